@@ -0,0 +1,60 @@
+"""One-time export of the food classification model to ONNX (used with USE_ORT=1)"""
+import argparse
+import logging
+
+import numpy as np
+import onnxruntime as ort
+import torch
+from transformers import ViTImageProcessor, ViTForImageClassification
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "nateraw/vit-base-food101"
+
+def export_onnx(output_path: str) -> None:
+    """Export the ViT model with a dynamic batch dimension"""
+    logger.info(f"Loading {MODEL_NAME}...")
+    model = ViTForImageClassification.from_pretrained(MODEL_NAME)
+    processor = ViTImageProcessor.from_pretrained(MODEL_NAME)
+    model.eval()
+
+    size = processor.size
+    dummy = torch.zeros(1, 3, size["height"], size["width"])
+    torch.onnx.export(
+        model,
+        (dummy,),
+        output_path,
+        # Trace a plain (logits,) tuple without changing the model's config
+        kwargs={"return_dict": False},
+        input_names=["pixel_values"],
+        output_names=["logits"],
+        opset_version=17,
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        # The TorchScript exporter; newer torch versions default to dynamo, which
+        # treats dynamic_axes differently
+        dynamo=False
+    )
+    logger.info(f"Exported ONNX model to {output_path}")
+    verify_onnx(output_path, model, dummy.shape[1:])
+
+def verify_onnx(output_path: str, model: ViTForImageClassification, input_shape: torch.Size) -> None:
+    """Check that the exported model runs a batch larger than 1 and matches PyTorch"""
+    batch = torch.randn(4, *input_shape)
+    session = ort.InferenceSession(output_path, providers=["CPUExecutionProvider"])
+    onnx_logits = session.run(None, {"pixel_values": batch.numpy()})[0]
+    with torch.inference_mode():
+        torch_logits = model(pixel_values=batch).logits.numpy()
+    
+    if onnx_logits.shape != torch_logits.shape:
+        raise RuntimeError(f"ONNX output shape {onnx_logits.shape} != PyTorch output shape {torch_logits.shape}")
+    max_diff = float(np.abs(onnx_logits - torch_logits).max())
+    if max_diff > 1e-3:
+        raise RuntimeError(f"ONNX logits differ from PyTorch by up to {max_diff:.2e}")
+    logger.info(f"Verified batch of {batch.shape[0]} through ONNX Runtime (max logit diff {max_diff:.2e})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the food ViT model to ONNX")
+    parser.add_argument("--output", default="vit_food.onnx", help="Path of the exported ONNX file")
+    args = parser.parse_args()
+    export_onnx(args.output)
@@ -1,17 +1,35 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from transformers import ViTImageProcessor, ViTForImageClassification
+from transformers import ViTConfig, ViTImageProcessor, ViTForImageClassification
 from PIL import Image, UnidentifiedImageError
 import torch
-import requests
+import torch.nn.functional as F
+import torchvision
+from torchvision.io import ImageReadMode
+from torchvision.transforms import v2
+import httpx
+import asyncio
 import io
+import json
 import os
+import struct
+import sys
+import tempfile
+import threading
 import logging
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Any, List, Optional, Tuple
 import time
 
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -43,14 +61,121 @@ if not NUTRITION_API_KEY:
     logger.error("NUTRITION_API_KEY not found in environment variables")
     raise ValueError("NUTRITION_API_KEY must be set in environment variables")
 
+USDA_SEARCH_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
+
+# Shared HTTP client so connections to the nutrition API are kept alive and reused
+HTTP = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=10.0,
+    http2=True
+)
+
+# Rate-limited (429), 5xx and timed out USDA calls are retried with jittered
+# exponential backoff; concurrent calls are capped to stay under the API quota
+NUTRITION_API_RETRIES = 3
+NUTRITION_API_CONCURRENCY = 20
+_nutrition_api_semaphore: Optional[asyncio.Semaphore] = None
+
+# Successful nutrition lookups are cached in-process, keyed by the cleaned label
+NUTRITION_CACHE_SIZE = 512
+_nutrition_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Modification time of NUTRITION_CACHE_FILE when it was last loaded
+_nutrition_cache_mtime: Optional[float] = None
+
+# Nutrition for every model label is fetched at startup and persisted here,
+# so later startups can serve /analyze without calling the nutrition API
+NUTRITION_CACHE_FILE = os.getenv("NUTRITION_CACHE_FILE", "nutrition_cache.json")
+NUTRITION_PRELOAD_CONCURRENCY = 5
+# Whether this process fetches nutrition for all labels at startup. `python main.py`
+# turns it off for its workers and preloads once from the parent process instead;
+# workers re-read the file it writes on their next cache miss
+PRELOAD_NUTRITION = os.getenv("PRELOAD_NUTRITION", "1") == "1"
+
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
 SUPPORTED_IMAGE_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp"}
+MIN_IMAGE_DIMENSION = 50
+MAX_IMAGE_DIMENSION = 10000
+# Bytes read from the start of an upload to find its dimensions without decoding
+HEADER_PEEK_SIZE = 64 * 1024
+
+# Micro-batching configuration: concurrent /analyze requests are coalesced into
+# a single forward pass of up to BATCH_SIZE images, waiting at most
+# BATCH_TIMEOUT_MS for a batch to fill
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "8"))
+BATCH_TIMEOUT_MS = float(os.getenv("BATCH_TIMEOUT_MS", "20"))
+
+# Process/thread layout: uvicorn worker processes, each with its own model copy
+# and a bounded thread pool for decode/preprocess/inference calls. WEB_CONCURRENCY
+# is the number of processes sharing the cores: __main__ sets it for the workers
+# it launches, while a plain `uvicorn main:app` runs a single process
+CPU_COUNT = os.cpu_count() or 1
+WORKER_PROCESSES = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", str(max(2, CPU_COUNT // WORKER_PROCESSES))))
+LIMIT_CONCURRENCY = int(os.getenv("LIMIT_CONCURRENCY", "0")) or None
+
+# OpenMP/MKL thread variables set explicitly by the user; the others are derived
+USER_THREAD_ENV = {name for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS") if name in os.environ}
+
+def intra_op_threads(processes: int) -> int:
+    """Intra-op CPU threads per process when `processes` workers share the cores"""
+    return int(os.getenv("INTRA_OP_THREADS", str(max(1, CPU_COUNT // processes))))
+
+def default_worker_count() -> int:
+    """Worker processes to launch when WEB_CONCURRENCY is not set"""
+    # Every worker holds its own model copy and batcher; on a GPU that also means a
+    # CUDA context and weight copy per worker, and micro-batches split N ways
+    if torch.cuda.is_available():
+        return 1
+    return max(1, CPU_COUNT // 2)
+
+def set_thread_env(threads: int) -> None:
+    """Bound OpenMP/MKL pools of processes started from now on, unless the user set them"""
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        if name not in USER_THREAD_ENV:
+            os.environ[name] = str(threads)
+
+# Split the cores between workers so N workers don't each start a full-size
+# OpenMP/MKL pool. The env vars only take effect in processes spawned later,
+# so __main__ sets them again for the workers before launching them
+INTRA_OP_THREADS = intra_op_threads(WORKER_PROCESSES)
+set_thread_env(INTRA_OP_THREADS)
+torch.set_num_threads(INTRA_OP_THREADS)
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    # Can only be set once per process, before any inter-op parallel work
+    pass
+
+MODEL_NAME = "nateraw/vit-base-food101"
+
+# Compile the model with torch.compile at startup (slower startup, faster inference)
+COMPILE_MODEL = os.getenv("COMPILE_MODEL", "0") == "1"
+
+# Serve the model with ONNX Runtime on the CPU instead of PyTorch.
+# The ONNX file is created once with export_onnx.py
+USE_ORT = os.getenv("USE_ORT", "0") == "1"
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "vit_food.onnx")
+
+# Apply INT8 dynamic quantization to the Linear layers when running on the CPU
+QUANTIZE = os.getenv("QUANTIZE", "0") == "1"
+
+# Inputs always have the same shape, so let cuDNN autotune the patch-embedding
+# convolution and allow TF32 matmuls for any remaining FP32 work
+torch.backends.cudnn.benchmark = True
+torch.set_float32_matmul_precision("high")
 
 class ModelManager:
     """Singleton class to manage model loading and inference"""
     _instance = None
     _model = None
+    _session = None
+    _config = None
     _processor = None
+    _input_hw = (224, 224)
+    _scale = None
+    _shift = None
+    _device = torch.device("cpu")
+    _is_compiled = False
     _is_loaded = False
 
     def __new__(cls):
@@ -63,14 +188,54 @@ class ModelManager:
         if not self._is_loaded:
             try:
                 logger.info("Loading ViT model and processor...")
-                self._model = ViTForImageClassification.from_pretrained("nateraw/vit-base-food101")
-                self._processor = ViTImageProcessor.from_pretrained("nateraw/vit-base-food101")
+                self._processor = ViTImageProcessor.from_pretrained(MODEL_NAME)
+                if USE_ORT:
+                    self._config = ViTConfig.from_pretrained(MODEL_NAME)
+                    self._session = self._create_ort_session()
+                else:
+                    self._model = ViTForImageClassification.from_pretrained(MODEL_NAME)
+                    self._config = self._model.config
+                    if torch.cuda.is_available():
+                        # Run on the GPU in half precision to use tensor cores
+                        self._device = torch.device("cuda")
+                        self._model = self._model.to(self._device).half()
+                        self._model = self._model.to(memory_format=torch.channels_last)
+                    elif QUANTIZE:
+                        self._model = torch.ao.quantization.quantize_dynamic(
+                            self._model, {torch.nn.Linear}, dtype=torch.qint8
+                        )
+                        logger.info("Applied INT8 dynamic quantization to Linear layers")
+                    self._model.eval()
+                    if COMPILE_MODEL:
+                        # Shapes are kept static by padding every batch to BATCH_SIZE in forward()
+                        self._model = torch.compile(self._model, mode="reduce-overhead", dynamic=False)
+                        self._is_compiled = True
+                # Cache the processor's resize + rescale + normalize parameters as device
+                # tensors: (x / 255 - mean) / std == x * scale - shift
+                size = self._processor.size
+                mean = torch.tensor(self._processor.image_mean, device=self._device).view(1, 3, 1, 1)
+                std = torch.tensor(self._processor.image_std, device=self._device).view(1, 3, 1, 1)
+                self._input_hw = (size["height"], size["width"])
+                self._scale = 1.0 / (255.0 * std)
+                self._shift = mean / std
                 self._is_loaded = True
-                logger.info("Model and processor loaded successfully")
+                backend = "onnxruntime" if USE_ORT else "pytorch"
+                logger.info(f"Model and processor loaded successfully (backend: {backend}, device: {self._device})")
             except Exception as e:
                 logger.error(f"Failed to load model: {e}")
                 raise HTTPException(status_code=500, detail="Failed to load AI model")
 
+    def _create_ort_session(self):
+        """Create an ONNX Runtime CPU session for the exported model"""
+        if ort is None:
+            raise RuntimeError("USE_ORT is set but onnxruntime is not installed")
+        if not os.path.exists(ONNX_MODEL_PATH):
+            raise RuntimeError(f"ONNX model not found: {ONNX_MODEL_PATH}. Run export_onnx.py first")
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.intra_op_num_threads = INTRA_OP_THREADS
+        return ort.InferenceSession(ONNX_MODEL_PATH, sess_options, providers=["CPUExecutionProvider"])
+
     @property
     def model(self):
         if not self._is_loaded:
@@ -83,32 +248,354 @@ class ModelManager:
             self.load_model()
         return self._processor
 
+    def preprocess(self, image: torch.Tensor) -> torch.Tensor:
+        """Convert a uint8 (3, H, W) image tensor into a (1, 3, H, W) pixel_values tensor"""
+        if not self._is_loaded:
+            self.load_model()
+        # Resize and normalize on the model's device so only uint8 pixels are transferred
+        pixel_values = image.to(self._device, non_blocking=True).unsqueeze(0).float()
+        pixel_values = F.interpolate(pixel_values, size=self._input_hw, mode="bilinear", antialias=True)
+        return pixel_values.mul_(self._scale).sub_(self._shift)
+
+    @property
+    def device(self) -> torch.device:
+        return self._device
+
+    @property
+    def input_size(self) -> Tuple[int, int]:
+        """Model input size as (width, height)"""
+        size = self.processor.size # type: ignore
+        return size["width"], size["height"]
+
+    @property
+    def id2label(self) -> Dict[int, str]:
+        if not self._is_loaded:
+            self.load_model()
+        return self._config.id2label # type: ignore
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Run the model on a batch of pixel_values and return the logits on the CPU"""
+        batch_size = pixel_values.shape[0]
+        if self._session is not None:
+            logits = self._session.run(None, {"pixel_values": pixel_values.cpu().numpy()})[0]
+            return torch.from_numpy(logits)
+        if self._is_compiled and batch_size < BATCH_SIZE:
+            padding = pixel_values.new_zeros((BATCH_SIZE - batch_size, *pixel_values.shape[1:]))
+            pixel_values = torch.cat([pixel_values, padding])
+        use_cuda = self._device.type == "cuda"
+        if use_cuda:
+            pixel_values = pixel_values.to(
+                self._device, dtype=torch.float16, memory_format=torch.channels_last, non_blocking=True
+            )
+        with torch.inference_mode(), torch.autocast("cuda", dtype=torch.float16, enabled=use_cuda):
+            logits = self.model(pixel_values=pixel_values).logits # type: ignore
+        return logits[:batch_size].float().cpu()
+
+    def warmup(self) -> None:
+        """Run a dummy full batch through the model so compilation happens before serving"""
+        size = self.processor.size # type: ignore
+        start_time = time.time()
+        self.forward(torch.zeros(BATCH_SIZE, 3, size["height"], size["width"]))
+        logger.info(f"Model warmup completed in {time.time() - start_time:.2f}s")
+
 # Initialize model manager
 model_manager = ModelManager()
 
-def validate_image(file: UploadFile) -> None:
-    """Validate uploaded image file"""
-    if file.content_type not in SUPPORTED_IMAGE_TYPES:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Unsupported image type. Supported types: {', '.join(SUPPORTED_IMAGE_TYPES)}"
+class InferenceBatcher:
+    """Coalesce concurrent inference requests into batched forward passes"""
+
+    def __init__(self, max_batch_size: int, timeout_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.timeout = timeout_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background batching task on the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Inference batcher started (batch size: {self.max_batch_size}, timeout: {self.timeout * 1000:.0f}ms)")
+
+    async def stop(self) -> None:
+        """Cancel the background batching task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, image: torch.Tensor) -> torch.Tensor:
+        """Queue an image for inference and wait for its logits"""
+        if self._queue is None:
+            raise RuntimeError("Inference batcher is not running")
+        # Resizing and normalizing is CPU-bound, keep it off the event loop
+        pixel_values = await asyncio.to_thread(model_manager.preprocess, image)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((pixel_values, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()] # type: ignore
+            deadline = loop.time() + self.timeout
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining)) # type: ignore
+                except asyncio.TimeoutError:
+                    break
+            await self._process(batch)
+
+    async def _process(self, batch: List[Tuple[torch.Tensor, asyncio.Future]]) -> None:
+        # Drop requests whose client has already gone away
+        batch = [(pixel_values, future) for pixel_values, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            pixel_values = torch.cat([item[0] for item in batch])
+            # Run the blocking forward pass off the event loop
+            logits = await asyncio.to_thread(model_manager.forward, pixel_values)
+        except Exception as e:
+            logger.error(f"Batched inference failed for {len(batch)} image(s): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(logits[i])
+
+batcher = InferenceBatcher(BATCH_SIZE, BATCH_TIMEOUT_MS)
+preload_task: Optional[asyncio.Task] = None
+
+def pil_to_tensor(image: Image.Image) -> torch.Tensor:
+    """Convert a PIL image into a uint8 RGB tensor of shape (3, H, W)"""
+    # convert() copies the full buffer even when the mode already matches
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return v2.functional.pil_to_tensor(image)
+
+def decode_image(
+    image_file: BinaryIO,
+    draft_size: Optional[Tuple[int, int]] = None,
+    device: Optional[torch.device] = None
+) -> torch.Tensor:
+    """Decode an image file object into a uint8 RGB tensor of shape (3, H, W)
+
+    When device is a CUDA device, JPEGs are decoded with nvJPEG straight into GPU
+    memory, falling back to the CPU path for JPEGs nvJPEG cannot handle. Otherwise
+    JPEGs are streamed into PIL's draft mode so libjpeg performs the IDCT at the
+    smallest 1/2, 1/4 or 1/8 scale that still covers draft_size, instead of
+    materializing a full-resolution buffer that is immediately downsampled.
+    """
+    image_file.seek(0)
+    is_jpeg = image_file.read(3) == b"\xff\xd8\xff"
+    image_file.seek(0)
+    if is_jpeg and device is not None and device.type == "cuda":
+        try:
+            return torchvision.io.decode_jpeg(
+                torch.frombuffer(bytearray(image_file.read()), dtype=torch.uint8),
+                mode=ImageReadMode.RGB,
+                device=device
+            )
+        except RuntimeError as e:
+            # nvJPEG rejects some JPEGs (e.g. CMYK or unusual progressive files)
+            logger.warning(f"GPU JPEG decode failed, decoding on the CPU instead: {e}")
+            image_file.seek(0)
+    if is_jpeg and draft_size is not None:
+        image = Image.open(image_file)
+        image.draft("RGB", draft_size)
+        return pil_to_tensor(image)
+    image_bytes = image_file.read()
+    try:
+        return torchvision.io.decode_image(
+            torch.frombuffer(bytearray(image_bytes), dtype=torch.uint8),
+            mode=ImageReadMode.RGB
         )
+    except RuntimeError:
+        # Fall back to PIL for formats torchvision cannot decode
+        return pil_to_tensor(Image.open(io.BytesIO(image_bytes)))
+
+def peek_dims(buf: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG, PNG or WebP header without decoding pixels"""
+    # PNG: dimensions are the first fields of the IHDR chunk
+    if buf[:8] == b"\x89PNG\r\n\x1a\n" and len(buf) >= 24:
+        return struct.unpack(">II", buf[16:24])
+
+    # JPEG: walk the marker segments up to the first start-of-frame (SOFn)
+    if buf[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 <= len(buf):
+            if buf[i] != 0xFF:
+                return None
+            marker = buf[i + 1]
+            if marker == 0xFF:
+                # Fill byte before a marker
+                i += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                # Standalone markers carry no length
+                i += 2
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", buf[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack(">H", buf[i + 2:i + 4])[0]
+        return None
+
+    # WebP: lossy (VP8), lossless (VP8L) and extended (VP8X) bitstreams
+    if buf[:4] == b"RIFF" and buf[8:12] == b"WEBP" and len(buf) >= 30:
+        chunk = buf[12:16]
+        if chunk == b"VP8 " and buf[23:26] == b"\x9d\x01\x2a":
+            width, height = struct.unpack("<HH", buf[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and buf[20] == 0x2F:
+            bits = struct.unpack("<I", buf[21:25])[0]
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(buf[24:27], "little") + 1, int.from_bytes(buf[27:30], "little") + 1
+    return None
+
+def validate_image(file: UploadFile) -> Optional[str]:
+    """Validate uploaded image file, returning an error message for invalid uploads"""
+    if file.content_type not in SUPPORTED_IMAGE_TYPES:
+        return f"Unsupported image type. Supported types: {', '.join(SUPPORTED_IMAGE_TYPES)}"
     
     if file.size and file.size > MAX_IMAGE_SIZE:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Image too large. Maximum size: {MAX_IMAGE_SIZE / (1024*1024):.1f}MB"
-        )
+        return f"Image too large. Maximum size: {MAX_IMAGE_SIZE / (1024*1024):.1f}MB"
+    return None
 
-def get_nutrition_data(food_label: str) -> Dict[str, Any]:
-    """Fetch nutrition data from CalorieNinjas API with error handling"""
+def validate_image_dims(image_file: BinaryIO) -> Optional[str]:
+    """Reject too small or too large images from their header alone"""
+    image_file.seek(0)
+    dims = peek_dims(image_file.read(HEADER_PEEK_SIZE))
+    image_file.seek(0)
+    if dims is None:
+        # Unknown layout (e.g. a very large EXIF block); the decoder validates instead
+        return None
+    width, height = dims
+    if width < MIN_IMAGE_DIMENSION or height < MIN_IMAGE_DIMENSION:
+        return f"Image too small. Minimum size: {MIN_IMAGE_DIMENSION}x{MIN_IMAGE_DIMENSION} pixels"
+    if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+        return f"Image too large. Maximum size: {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION} pixels"
+    return None
+
+async def get_nutrition_data(food_label: str) -> Dict[str, Any]:
+    """Fetch nutrition data, serving repeated labels from an in-process LRU cache"""
+    # Clean the food label for better API results
+    clean_label = food_label.replace("_", " ").strip()
+    cached = _nutrition_cache.get(clean_label)
+    if cached is not None:
+        _nutrition_cache.move_to_end(clean_label)
+        return cached
+
+    # Another process (the preloading parent) may have written the label since
+    # this one started; re-read the file before calling the nutrition API
+    if load_nutrition_cache():
+        cached = _nutrition_cache.get(clean_label)
+        if cached is not None:
+            return cached
+
+    nutrition = await _fetch_nutrition_uncached(clean_label)
+    # Only cache successful lookups so transient API errors are retried
+    if "error" not in nutrition:
+        _nutrition_cache[clean_label] = nutrition
+        if len(_nutrition_cache) > NUTRITION_CACHE_SIZE:
+            _nutrition_cache.popitem(last=False)
+    return nutrition
+
+def load_nutrition_cache() -> bool:
+    """Load persisted nutrition lookups into the in-memory cache if the file changed since the last load"""
+    global _nutrition_cache_mtime
+    try:
+        mtime = os.stat(NUTRITION_CACHE_FILE).st_mtime
+    except OSError:
+        return False
+    if mtime == _nutrition_cache_mtime:
+        return False
+    try:
+        with open(NUTRITION_CACHE_FILE, "r", encoding="utf-8") as f:
+            _nutrition_cache.update(json.load(f))
+        _nutrition_cache_mtime = mtime
+        logger.info(f"Loaded {len(_nutrition_cache)} nutrition entries from {NUTRITION_CACHE_FILE}")
+        return True
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable nutrition cache file {NUTRITION_CACHE_FILE}: {e}")
+        return False
+
+async def preload_nutrition_cache(labels: List[str]) -> None:
+    """Fetch nutrition data for all labels missing from the cache and persist the result"""
+    global _nutrition_cache_mtime
+    semaphore = asyncio.Semaphore(NUTRITION_PRELOAD_CONCURRENCY)
+
+    async def fetch(label: str) -> None:
+        async with semaphore:
+            await get_nutrition_data(label)
+
+    missing = [label for label in labels if label.replace("_", " ").strip() not in _nutrition_cache]
+    if not missing:
+        return
+    logger.info(f"Preloading nutrition data for {len(missing)} labels...")
+    await asyncio.gather(*(fetch(label) for label in missing))
+    tmp_path = None
+    try:
+        # Write to a uniquely named file and rename it into place, so readers never
+        # see a partial file and concurrent writers never replace each other's
+        cache_dir = os.path.dirname(os.path.abspath(NUTRITION_CACHE_FILE))
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=cache_dir, prefix=".nutrition_cache.", suffix=".tmp", delete=False
+        ) as f:
+            tmp_path = f.name
+            json.dump(_nutrition_cache, f)
+        os.replace(tmp_path, NUTRITION_CACHE_FILE)
+        _nutrition_cache_mtime = os.stat(NUTRITION_CACHE_FILE).st_mtime
+        logger.info(f"Saved {len(_nutrition_cache)} nutrition entries to {NUTRITION_CACHE_FILE}")
+    except OSError as e:
+        logger.warning(f"Failed to save nutrition cache: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def preload_nutrition_in_background() -> None:
+    """Preload the nutrition cache once from the parent process while its workers serve requests"""
+    labels = list(ViTConfig.from_pretrained(MODEL_NAME).id2label.values())
+    load_nutrition_cache()
+    threading.Thread(
+        target=asyncio.run, args=(preload_nutrition_cache(labels),), name="nutrition-preload", daemon=True
+    ).start()
+
+async def _usda_search(query: str) -> httpx.Response:
+    """Search USDA FoodData Central, retrying transient failures with backoff"""
+    global _nutrition_api_semaphore
+    if _nutrition_api_semaphore is None:
+        _nutrition_api_semaphore = asyncio.Semaphore(NUTRITION_API_CONCURRENCY)
+    async with _nutrition_api_semaphore:
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(NUTRITION_API_RETRIES),
+                wait=wait_exponential_jitter(initial=0.2, max=2),
+                retry=retry_if_exception_type((httpx.HTTPStatusError, httpx.TimeoutException)),
+                reraise=True
+            ):
+                with attempt:
+                    response = await HTTP.get(USDA_SEARCH_URL, params={"query": query, "api_key": NUTRITION_API_KEY})
+                    if response.status_code == 429 or response.status_code >= 500:
+                        response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            # Out of retries: hand the last response back so the caller reports its status
+            return e.response
+    return response
+
+async def _fetch_nutrition_uncached(clean_label: str) -> Dict[str, Any]:
+    """Fetch nutrition data from USDA FoodData Central with error handling"""
     try:
-        # Clean the food label for better API results
-        clean_label = food_label.replace("_", " ").strip()
-        api_key = NUTRITION_API_KEY
         # 1. Search for food item
-        search_url = f"https://api.nal.usda.gov/fdc/v1/foods/search?query={clean_label}&api_key={api_key}"
-        search_resp = requests.get(search_url, timeout=10)
+        search_resp = await _usda_search(clean_label)
         if search_resp.status_code == 401:
             logger.error("Invalid API key for USDA FoodData Central")
             return {"error": "Nutrition API authentication failed"}
@@ -124,8 +611,7 @@ def get_nutrition_data(food_label: str) -> Dict[str, Any]:
             # Fallback: try first word
             fallback_label = clean_label.split()[0] if len(clean_label.split()) > 1 else clean_label
             logger.info(f"Trying fallback nutrition lookup: {fallback_label}")
-            fallback_url = f"https://api.nal.usda.gov/fdc/v1/foods/search?query={fallback_label}&api_key={api_key}"
-            fallback_resp = requests.get(fallback_url, timeout=10)
+            fallback_resp = await _usda_search(fallback_label)
             fallback_data = fallback_resp.json() if fallback_resp.status_code == 200 else None
             fallback_foods = fallback_data.get("foods", []) if fallback_data else []
             if fallback_foods:
@@ -156,56 +642,48 @@ def get_nutrition_data(food_label: str) -> Dict[str, Any]:
             "sodium_mg": get_nutrient(nutrients, "Sodium"),
             "food_name": food.get("description", "")
         }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("Timeout when calling USDA API")
         return {"error": "Nutrition API timeout. Please try again"}
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         logger.error("Connection error when calling USDA API")
         return {"error": "Cannot connect to nutrition API"}
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Request error when calling USDA API: {e}")
         return {"error": "Nutrition API request failed"}
     except Exception as e:
         logger.error(f"Unexpected error in nutrition API call: {e}")
         return {"error": "Unexpected error occurred"}
 
-def predict_food_and_nutrition(image_bytes: bytes) -> Dict[str, Any]:
+async def predict_food_and_nutrition(image_file: BinaryIO) -> Dict[str, Any]:
     """Predict food and get nutrition information with comprehensive error handling"""
     try:
-        # Ensure model is loaded
-        model_manager.load_model()  # Always call load_model to ensure model and processor are loaded
-            
         # Load and validate image
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            image = await asyncio.to_thread(
+                decode_image, image_file, model_manager.input_size, model_manager.device
+            )
         except UnidentifiedImageError:
             return {"error": "Invalid image format or corrupted image"}
         except Exception as e:
             logger.error(f"Error processing image: {e}")
             return {"error": "Failed to process image"}
 
-        # Validate image dimensions and resize if necessary
-        max_dimension = 2000  # Reduced from 4000 for better performance
-        if image.size[0] > max_dimension or image.size[1] > max_dimension:
-            # Calculate new size maintaining aspect ratio
-            ratio = min(max_dimension / image.size[0], max_dimension / image.size[1])
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-            logger.info(f"Resized image from {image.size} to {new_size}")
-        
-        if image.size[0] < 50 or image.size[1] < 50:
-            return {"error": "Image too small. Minimum size: 50x50 pixels"}
+        # Validate image dimensions (the transform resizes straight to the model input size)
+        height, width = image.shape[-2:]
+        if width < MIN_IMAGE_DIMENSION or height < MIN_IMAGE_DIMENSION:
+            return {"error": f"Image too small. Minimum size: {MIN_IMAGE_DIMENSION}x{MIN_IMAGE_DIMENSION} pixels"}
 
         # Process image and make prediction
         try:
             start_time = time.time()
-            inputs = model_manager.processor(images=image, return_tensors="pt") # type: ignore
+            logits = await batcher.submit(image)
             
-            with torch.no_grad():
-                logits = model_manager.model(**inputs).logits # type: ignore
-                predicted_idx = logits.argmax(-1).item()
-                confidence = torch.softmax(logits, dim=-1).max().item()
-                label = model_manager.model.config.id2label[predicted_idx] # type: ignore
+            # Top-1 probability via log-sum-exp, without materializing the full softmax
+            max_logit, predicted_idx = logits.max(dim=-1)
+            confidence = (max_logit - torch.logsumexp(logits, dim=-1)).exp().item()
+            predicted_idx = predicted_idx.item()
+            label = model_manager.id2label[predicted_idx]
             
             inference_time = time.time() - start_time
             logger.info(f"Food prediction: {label} (confidence: {confidence:.3f}, time: {inference_time:.3f}s)")
@@ -217,7 +695,7 @@ def predict_food_and_nutrition(image_bytes: bytes) -> Dict[str, Any]:
             return {"error": "Failed to analyze image with AI model"}
 
         # Get nutrition data
-        nutrition_info = get_nutrition_data(label)
+        nutrition_info = await get_nutrition_data(label)
         
         return {
             "predicted_food": label.replace("_", " "),
@@ -234,9 +712,29 @@ def predict_food_and_nutrition(image_bytes: bytes) -> Dict[str, Any]:
 async def startup_event():
     """Load model on startup"""
     logger.info("Starting Food and Nutrition API...")
+    # asyncio.to_thread uses the default executor; bound its fan-out per worker
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="inference")
+    )
     model_manager.load_model()
+    model_manager.warmup()
+    batcher.start()
+    # Warm the nutrition cache in the background; requests arriving before it
+    # finishes fall back to live lookups
+    global preload_task
+    load_nutrition_cache()
+    if PRELOAD_NUTRITION:
+        preload_task = asyncio.create_task(preload_nutrition_cache(list(model_manager.id2label.values())))
     logger.info("API ready to serve requests")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and close pooled connections on shutdown"""
+    if preload_task is not None and not preload_task.done():
+        preload_task.cancel()
+    await batcher.stop()
+    await HTTP.aclose()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -276,25 +774,38 @@ async def test_upload(file: UploadFile = File(...)):
 async def analyze_image(file: UploadFile = File(...)):
     """Analyze uploaded food image and return nutrition information"""
     try:
-        logger.info(f"Received file upload: filename={file.filename}, content_type={file.content_type}, size={file.size}")
+        # Debug logging is guarded so the hot path doesn't pay for string formatting
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Received file upload: filename={file.filename}, content_type={file.content_type}, size={file.size}")
         
-        # Validate file
-        validate_image(file)
+        # Validate file; rejections are plain responses rather than exceptions
+        error = validate_image(file)
+        if error:
+            return JSONResponse(status_code=400, content={"error": error})
         
-        # Read image bytes
+        # Decode straight from the upload's SpooledTemporaryFile instead of
+        # copying the whole body into a bytes object first
         try:
-            image_bytes = await file.read()
-            logger.info(f"Successfully read {len(image_bytes)} bytes from uploaded file")
+            image_file = file.file
+            file_size = file.size if file.size is not None else image_file.seek(0, os.SEEK_END)
+            image_file.seek(0)
+            if debug:
+                logger.debug(f"Streaming {file_size} bytes from uploaded file")
         except Exception as e:
             logger.error(f"Failed to read uploaded file: {e}")
             raise HTTPException(status_code=400, detail="Failed to read uploaded file")
         
-        if len(image_bytes) == 0:
+        if file_size == 0:
             logger.error("Empty file uploaded")
-            raise HTTPException(status_code=400, detail="Empty file uploaded")
+            return JSONResponse(status_code=400, content={"error": "Empty file uploaded"})
+        
+        error = validate_image_dims(image_file)
+        if error:
+            return JSONResponse(status_code=400, content={"error": error})
         
         # Process image and get results
-        result = predict_food_and_nutrition(image_bytes)
+        result = await predict_food_and_nutrition(image_file)
         
         # Check for errors in result
         if "error" in result:
@@ -304,7 +815,8 @@ async def analyze_image(file: UploadFile = File(...)):
                 content=result
             )
         
-        logger.info(f"Analysis successful: {result.get('predicted_food', 'unknown')}")
+        if debug:
+            logger.debug(f"Analysis successful: {result.get('predicted_food', 'unknown')}")
         return result
         
     except HTTPException:
@@ -315,4 +827,23 @@ async def analyze_image(file: UploadFile = File(...)):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("WEB_CONCURRENCY", "0")) or default_worker_count()
+    # Workers re-import this module: tell them how many processes share the cores,
+    # and size the OpenMP/MKL pools they create when importing torch
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    set_thread_env(intra_op_threads(workers))
+    if workers > 1 and PRELOAD_NUTRITION:
+        # One preload for the whole server instead of one per worker
+        os.environ["PRELOAD_NUTRITION"] = "0"
+        preload_nutrition_in_background()
+    # An import string is required for uvicorn to spawn multiple workers
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        limit_concurrency=LIMIT_CONCURRENCY,
+        # libuv event loop and C HTTP parser; uvloop is not available on Windows
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
+    )
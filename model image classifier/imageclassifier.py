@@ -1,13 +1,36 @@
 import os
+import functools
 import logging
-from typing import Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 from dotenv import load_dotenv
 from transformers import ViTImageProcessor, ViTForImageClassification
-from PIL import Image, UnidentifiedImageError
+import cv2
+import numpy as np
 import torch
-import requests
+import torch.nn.functional as F
+from torchvision.io import ImageReadMode, decode_jpeg
+import httpx
+import msgspec
 import time
 
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+except ImportError:
+    ort = None
+
+try:
+    import intel_extension_for_pytorch as ipex
+except ImportError:
+    ipex = None
+
+try:
+    import tensorrt as trt
+except ImportError:
+    trt = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,13 +38,244 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+MODEL_NAME = "nateraw/vit-base-food101"
+
+# Exported ONNX models are cached next to this script and reused across runs
+ONNX_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food.onnx")
+ONNX_INT8_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food.int8.onnx")
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+# DCT-domain downscaling factors libjpeg can apply while decoding, largest first
+JPEG_REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+
+# Predictions below this top-1 probability skip the nutrition lookup
+CONFIDENCE_THRESHOLD = 0.3
+
+# TensorRT engine and INT8 calibration table built from the ONNX export
+# Serialized engines only load on the TensorRT version and GPU architecture that built
+# them, so both are part of the file name along with the precision
+TRT_ENGINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food.{precision}.trt{version}.sm{arch}.trt")
+TRT_CALIBRATION_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food.calib")
+TRT_MAX_BATCH = 32
+TRT_CALIBRATION_IMAGES = 100
+
+# Standardized USDA nutrient names and the name variations that map to them
+NUTRIENT_MAP = {
+    'Energy': ['Energy', 'Calories'],
+    'Protein': ['Protein'],
+    'Total lipid (fat)': ['Total lipid (fat)', 'Fat, total'],
+    'Carbohydrate, by difference': ['Carbohydrate, by difference', 'Carbohydrates'],
+    'Fiber, total dietary': ['Fiber, total dietary', 'Dietary fiber'],
+    'Sugars, total including NLEA': ['Sugars, total including NLEA', 'Sugars'],
+    'Sodium, Na': ['Sodium, Na', 'Sodium']
+}
+
+# Nutrients field holding each standardized nutrient
+NUTRIENT_FIELDS = {
+    'Energy': 'calories',
+    'Protein': 'protein',
+    'Total lipid (fat)': 'fat',
+    'Carbohydrate, by difference': 'carbs',
+    'Fiber, total dietary': 'fiber',
+    'Sugars, total including NLEA': 'sugars',
+    'Sodium, Na': 'sodium'
+}
+
+# Flattened {lowercased variation: Nutrients field} table, built once. Keys are
+# also kept longest-first so substring matching prefers the most specific one
+NUTRIENT_LOOKUP = {
+    var.lower(): NUTRIENT_FIELDS[standard_name]
+    for standard_name, variations in NUTRIENT_MAP.items()
+    for var in variations
+}
+NUTRIENT_KEYS_BY_LENGTH = tuple(sorted(NUTRIENT_LOOKUP, key=len, reverse=True))
+
+class USDANutrient(msgspec.Struct):
+    """Nutrient entry of a USDA search result; unlisted fields are skipped while decoding"""
+    nutrientName: str = ""
+    # USDA sends null for some unmeasured nutrients
+    value: Optional[float] = None
+    unitName: str = ""
+
+class USDAFood(msgspec.Struct):
+    """Food entry of a USDA search result"""
+    description: Optional[str] = None
+    dataType: str = "Unknown"
+    fdcId: Optional[int] = None
+    foodNutrients: List[USDANutrient] = []
+
+class USDASearchResponse(msgspec.Struct):
+    """Top level of a USDA /foods/search response"""
+    foods: List[USDAFood] = []
+
+USDA_RESPONSE_DECODER = msgspec.json.Decoder(USDASearchResponse)
+
+class Nutrients(msgspec.Struct, frozen=True):
+    """Numeric nutrient values of a USDA food; formatted only when a response is built"""
+    calories: Optional[float] = None
+    protein: Optional[float] = None
+    fat: Optional[float] = None
+    carbs: Optional[float] = None
+    fiber: Optional[float] = None
+    sugars: Optional[float] = None
+    sodium: Optional[float] = None
+    units: Dict[str, str] = {}
+    
+    def formatted(self) -> Dict[str, str]:
+        """Render each known value as "<value> <unit>", keyed by field name"""
+        values = {}
+        for field in NUTRIENT_FIELDS.values():
+            value = getattr(self, field)
+            if value is not None:
+                # Whole numbers print without a trailing .0, as USDA sends them
+                number = int(value) if float(value).is_integer() else value
+                values[field] = f"{number} {self.units.get(field, '')}"
+        return values
+
+class USDALookupError(Exception):
+    """Raised for USDA lookups that failed and must not be cached"""
+    
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get("error"))
+        self.result = result
+
+def jpeg_size(data: np.ndarray) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG's SOF segment without decoding any pixels"""
+    buf = memoryview(data)
+    pos = 2
+    while pos + 9 < len(buf):
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Standalone markers have no length field
+            pos += 2
+            continue
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC) which share the range
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (buf[pos + 5] << 8) | buf[pos + 6]
+            width = (buf[pos + 7] << 8) | buf[pos + 8]
+            return width, height
+        pos += 2 + ((buf[pos + 2] << 8) | buf[pos + 3])
+    return None
+
+@functools.cache
+def _load_processor(model_name: str) -> ViTImageProcessor:
+    """Load the image processor once per process, preferring the local Hugging Face cache"""
+    try:
+        return ViTImageProcessor.from_pretrained(model_name, local_files_only=True)
+    except OSError:
+        logger.info(f"{model_name} processor not found in the local cache, downloading it")
+        return ViTImageProcessor.from_pretrained(model_name)
+
+def _load_pretrained(
+    model_name: str, dtype: torch.dtype = torch.float32
+) -> Tuple[ViTForImageClassification, ViTImageProcessor]:
+    """Load a fresh model and the shared, read-only processor, preferring the local Hugging Face cache"""
+    # Not memoized: each classifier converts or drops its model, and a kept FP32 copy
+    # would outlive it. Repeat loads read the safetensors file from the page cache
+    try:
+        model = ViTForImageClassification.from_pretrained(
+            model_name, torch_dtype=dtype, low_cpu_mem_usage=True, local_files_only=True
+        )
+    except OSError:
+        logger.info(f"{model_name} not found in the local cache, downloading it")
+        model = ViTForImageClassification.from_pretrained(model_name, torch_dtype=dtype, low_cpu_mem_usage=True)
+    
+    # Frozen parameters carry no autograd state, on top of inference_mode in _forward
+    model.eval().requires_grad_(False)
+    return model, _load_processor(model_name)
+
+if trt is not None:
+    class _EntropyCalibrator(trt.IInt8EntropyCalibrator2):
+        """Feeds preprocessed food images to TensorRT's INT8 calibration one at a time"""
+        
+        def __init__(self, images: List[np.ndarray]):
+            trt.IInt8EntropyCalibrator2.__init__(self)
+            self._images = iter(images)
+            self._device_image: Optional[torch.Tensor] = None
+        
+        def get_batch_size(self) -> int:
+            return 1
+        
+        def get_batch(self, names: List[str]) -> Optional[List[int]]:
+            image = next(self._images, None)
+            if image is None:
+                return None
+            # Keep a reference so the device memory outlives this call
+            self._device_image = torch.from_numpy(image[None]).cuda()
+            return [int(self._device_image.data_ptr())]
+        
+        def read_calibration_cache(self) -> Optional[bytes]:
+            if os.path.exists(TRT_CALIBRATION_CACHE):
+                with open(TRT_CALIBRATION_CACHE, "rb") as f:
+                    return f.read()
+            return None
+        
+        def write_calibration_cache(self, cache: Any) -> None:
+            with open(TRT_CALIBRATION_CACHE, "wb") as f:
+                f.write(cache)
+
 class FoodClassifier:
     """Efficient food classifier with model caching and error handling"""
     
-    def __init__(self):
+    def __init__(self, quantize: bool = True, backend: str = "torch", compile_model: bool = False):
+        if backend not in ("torch", "onnx", "tensorrt"):
+            raise ValueError(f"Unsupported backend: {backend}. Supported: torch, onnx, tensorrt")
+        if backend == "onnx" and ort is None:
+            logger.warning("onnxruntime is not installed, falling back to the PyTorch backend")
+            backend = "torch"
+        if backend == "tensorrt" and (trt is None or not torch.cuda.is_available()):
+            logger.warning("TensorRT or CUDA is not available, falling back to the PyTorch backend")
+            backend = "torch"
+        
         self.model: Optional[ViTForImageClassification] = None
         self.processor: Optional[ViTImageProcessor] = None
+        self.ort_session = None
+        self.trt_engine = None
+        self.trt_context = None
+        self._trt_stream: Optional[torch.cuda.Stream] = None
+        self._trt_output: Optional[torch.Tensor] = None
+        self.id2label: Dict[int, str] = {}
+        self.input_size = (224, 224)
+        self._mean: Optional[np.ndarray] = None
+        self._inv_std: Optional[np.ndarray] = None
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # Known before the model loads so images can be decoded while it does
+        self._gpu_decode = self.device.type == "cuda" and backend != "onnx"
+        # NHWC lets oneDNN/cuDNN pick their fastest conv kernels; ONNX Runtime and
+        # TensorRT bindings expect contiguous NCHW input, so only PyTorch uses it
+        self._memory_format = torch.channels_last if backend == "torch" else torch.contiguous_format
+        self._mean_t: Optional[torch.Tensor] = None
+        self._inv_std_t: Optional[torch.Tensor] = None
+        # Reusable batch input buffers (pinned host + device on CUDA), grown on demand
+        self._host_input: Optional[torch.Tensor] = None
+        self._device_input: Optional[torch.Tensor] = None
+        self._input_lock = threading.Lock()
+        # Reduced precision used for the PyTorch forward, if any
+        self._autocast_dtype: Optional[torch.dtype] = None
         self.is_loaded = False
+        self.quantize = quantize
+        self.compile_model = compile_model
+        self.backend = backend
+        # Shared pool for parallel image preprocessing and nutrition lookups
+        self._pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        # Successful USDA lookups are cached per lowercased food name
+        self._usda_lookup = functools.lru_cache(maxsize=4096)(self._fetch_usda)
+        # Persistent HTTP/2 client so USDA lookups reuse keep-alive connections
+        self._http = httpx.Client(
+            http2=True,
+            timeout=15,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
         self.api_key = os.getenv("USDA_API_KEY")
         
         if not self.api_key:
@@ -35,8 +289,38 @@ class FoodClassifier:
                 logger.info("Loading ViT model and processor...")
                 start_time = time.time()
                 
-                self.model = ViTForImageClassification.from_pretrained("nateraw/vit-base-food101")
-                self.processor = ViTImageProcessor.from_pretrained("nateraw/vit-base-food101")
+                # FP16 weights are loaded directly for CUDA inference
+                use_fp16 = self.device.type == "cuda" and self.backend == "torch"
+                self.model, self.processor = _load_pretrained(
+                    MODEL_NAME, torch.float16 if use_fp16 else torch.float32
+                )
+                self.id2label = self.model.config.id2label
+                self._configure_preprocessing(self.processor)
+                
+                if self.backend == "onnx":
+                    self._load_onnx_session()
+                elif self.device.type == "cuda":
+                    # Keep the model and the whole preprocessing pipeline on the GPU
+                    self._mean_t = torch.from_numpy(self._mean).to(self.device).view(3, 1, 1)
+                    self._inv_std_t = torch.from_numpy(self._inv_std).to(self.device).view(3, 1, 1)
+                    if self.backend == "tensorrt":
+                        self._load_tensorrt_engine()
+                    else:
+                        # INT8 dynamic quantization is CPU-only so FP16 is used instead,
+                        # halving weight traffic and running matmuls on Tensor Cores
+                        self.model = self.model.to(self.device)
+                        self._autocast_dtype = torch.float16
+                elif self.quantize:
+                    self._quantize_model()
+                elif self._cpu_supports_bf16():
+                    self._autocast_dtype = torch.bfloat16
+                    logger.info("Using BF16 autocast for CPU inference")
+                
+                if self.model is not None:
+                    self.model = self.model.to(memory_format=self._memory_format)
+                
+                if self.model is not None and self.compile_model:
+                    self._compile_model()
                 
                 load_time = time.time() - start_time
                 self.is_loaded = True
@@ -46,6 +330,282 @@ class FoodClassifier:
                 logger.error(f"Failed to load model: {e}")
                 raise RuntimeError(f"Model loading failed: {e}")
     
+    @staticmethod
+    def _cpu_supports_bf16() -> bool:
+        """Whether oneDNN has native BF16 kernels on this CPU (AVX-512-BF16 / AMX)"""
+        try:
+            return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+        except (AttributeError, RuntimeError):
+            return False
+    
+    def _compile_model(self) -> None:
+        """Fuse the PyTorch graph with IPEX (Intel CPUs) or torch.compile and warm it up"""
+        if ipex is not None and self.device.type == "cpu" and not self.quantize:
+            self.model = ipex.optimize(self.model, dtype=self._autocast_dtype or torch.float32, level="O1")
+            logger.info("Optimized model with Intel Extension for PyTorch")
+        else:
+            # CUDA graphs only pay off on the GPU; dynamic=False specializes on the input shape
+            mode = "reduce-overhead" if self.device.type == "cuda" else "default"
+            self.model = torch.compile(self.model, mode=mode, dynamic=False)
+            logger.info(f"Compiled model with torch.compile (mode={mode})")
+        
+        # Trigger compilation now so the first real request doesn't pay for it
+        warmup_start = time.time()
+        self._forward(torch.zeros(1, 3, *self.input_size, device=self.device, memory_format=self._memory_format))
+        logger.info(f"Model warmup completed in {time.time() - warmup_start:.2f} seconds")
+    
+    def _quantize_model(self) -> None:
+        """Apply INT8 dynamic quantization to the model's Linear layers"""
+        # Thread count dominates CPU INT8 throughput, so use every core
+        torch.set_num_threads(os.cpu_count() or 1)
+        
+        supported = torch.backends.quantized.supported_engines
+        engine = next((e for e in ("x86", "fbgemm", "onednn") if e in supported), None)
+        if engine is None:
+            logger.warning(f"No INT8 quantization engine available (supported: {supported}), using FP32 model")
+            return
+        
+        torch.backends.quantized.engine = engine
+        self.model = torch.ao.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        logger.info(f"Applied INT8 dynamic quantization using the {engine} engine")
+    
+    def _export_onnx(self) -> None:
+        """Export the FP32 PyTorch model to ONNX once, with a dynamic batch axis"""
+        if not os.path.exists(ONNX_MODEL_PATH):
+            logger.info(f"Exporting model to ONNX: {ONNX_MODEL_PATH}")
+            size = self.processor.size # type: ignore
+            dummy = torch.zeros(1, 3, size["height"], size["width"])
+            torch.onnx.export(
+                self.model,
+                (dummy,),
+                ONNX_MODEL_PATH,
+                kwargs={"return_dict": False},
+                input_names=["pixel_values"],
+                output_names=["logits"],
+                opset_version=17,
+                dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+                # dynamic_axes is only honored as written by the tracing exporter
+                dynamo=False
+            )
+            try:
+                self._verify_onnx()
+            except Exception:
+                # Don't leave a broken export behind to be reused on the next run
+                os.remove(ONNX_MODEL_PATH)
+                raise
+    
+    def _verify_onnx(self) -> None:
+        """Run a batch of 4 through the fresh export and compare its logits with the PyTorch model"""
+        if ort is None:
+            logger.warning("onnxruntime is not installed, skipping ONNX export verification")
+            return
+        
+        batch = torch.randn(4, 3, *self.input_size)
+        session = ort.InferenceSession(ONNX_MODEL_PATH, providers=["CPUExecutionProvider"])
+        onnx_logits = session.run(None, {"pixel_values": batch.numpy()})[0]
+        with torch.inference_mode():
+            torch_logits = self.model(pixel_values=batch).logits.numpy() # type: ignore
+        
+        if onnx_logits.shape != torch_logits.shape:
+            raise RuntimeError(f"ONNX output shape {onnx_logits.shape} != PyTorch output shape {torch_logits.shape}")
+        max_diff = float(np.abs(onnx_logits - torch_logits).max())
+        if max_diff > 1e-3:
+            raise RuntimeError(f"ONNX logits differ from PyTorch by up to {max_diff:.2e}")
+        logger.info(f"Verified batch of {batch.shape[0]} through ONNX Runtime (max logit diff {max_diff:.2e})")
+    
+    def _load_onnx_session(self) -> None:
+        """Export the model to ONNX (INT8 if quantizing) once and create an inference session"""
+        self._export_onnx()
+        model_path = ONNX_MODEL_PATH
+        if self.quantize:
+            if not os.path.exists(ONNX_INT8_MODEL_PATH):
+                logger.info(f"Quantizing ONNX model to INT8: {ONNX_INT8_MODEL_PATH}")
+                quantize_dynamic(ONNX_MODEL_PATH, ONNX_INT8_MODEL_PATH, weight_type=QuantType.QInt8)
+            model_path = ONNX_INT8_MODEL_PATH
+        
+        providers = ["CPUExecutionProvider"]
+        if "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.ort_session = ort.InferenceSession(model_path, providers=providers)
+        # The PyTorch weights are no longer needed once the session exists
+        self.model = None
+        logger.info(f"Created ONNX Runtime session for {os.path.basename(model_path)} ({providers[0]})")
+    
+    def _load_tensorrt_engine(self) -> None:
+        """Load or build the engine for this precision, TensorRT version and GPU, and create an execution context"""
+        trt_logger = trt.Logger(trt.Logger.WARNING)
+        precision = self._tensorrt_precision()
+        major, minor = torch.cuda.get_device_capability(self.device)
+        engine_path = TRT_ENGINE_PATH.format(precision=precision, version=trt.__version__, arch=f"{major}{minor}")
+        
+        self.trt_engine = None
+        if os.path.exists(engine_path):
+            with open(engine_path, "rb") as f:
+                self.trt_engine = trt.Runtime(trt_logger).deserialize_cuda_engine(f.read())
+            if self.trt_engine is None:
+                logger.warning(f"Failed to deserialize TensorRT engine {engine_path}, rebuilding it")
+        if self.trt_engine is None:
+            self._export_onnx()
+            self._build_tensorrt_engine(trt_logger, precision, engine_path)
+            with open(engine_path, "rb") as f:
+                self.trt_engine = trt.Runtime(trt_logger).deserialize_cuda_engine(f.read())
+            if self.trt_engine is None:
+                raise RuntimeError(f"Failed to deserialize TensorRT engine: {engine_path}")
+        
+        self.trt_context = self.trt_engine.create_execution_context()
+        self._trt_stream = torch.cuda.Stream()
+        self._trt_output = torch.empty((TRT_MAX_BATCH, len(self.id2label)), device=self.device)
+        # The PyTorch weights are no longer needed once the engine exists
+        self.model = None
+        logger.info(f"Loaded TensorRT engine {os.path.basename(engine_path)}")
+    
+    def _tensorrt_precision(self) -> str:
+        """INT8 when quantizing and calibration data is available, FP16 otherwise"""
+        if not self.quantize:
+            return "fp16"
+        calibration_dir = os.getenv("TRT_CALIBRATION_DIR")
+        if os.path.exists(TRT_CALIBRATION_CACHE) or (calibration_dir and os.path.isdir(calibration_dir)):
+            return "int8"
+        logger.warning("No TRT_CALIBRATION_DIR images or calibration cache found, using an FP16 engine")
+        return "fp16"
+    
+    def _build_tensorrt_engine(self, trt_logger: Any, precision: str, engine_path: str) -> None:
+        """Compile the exported ONNX model into a serialized TensorRT engine"""
+        logger.info(f"Building TensorRT engine: {engine_path}")
+        builder = trt.Builder(trt_logger)
+        network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+        parser = trt.OnnxParser(network, trt_logger)
+        with open(ONNX_MODEL_PATH, "rb") as f:
+            if not parser.parse(f.read()):
+                errors = "; ".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+                raise RuntimeError(f"Failed to parse {ONNX_MODEL_PATH}: {errors}")
+        
+        config = builder.create_builder_config()
+        config.set_flag(trt.BuilderFlag.FP16)
+        shape = (3, *self.input_size)
+        profile = builder.create_optimization_profile()
+        profile.set_shape("pixel_values", (1, *shape), (8, *shape), (TRT_MAX_BATCH, *shape))
+        config.add_optimization_profile(profile)
+        
+        if precision == "int8":
+            images = self._calibration_images()
+            if not images and not os.path.exists(TRT_CALIBRATION_CACHE):
+                raise RuntimeError("TRT_CALIBRATION_DIR contains no readable images for INT8 calibration")
+            # Layers without INT8 kernels fall back to FP16
+            config.set_flag(trt.BuilderFlag.INT8)
+            config.int8_calibrator = _EntropyCalibrator(images)
+            config.set_calibration_profile(profile)
+        
+        serialized = builder.build_serialized_network(network, config)
+        if serialized is None:
+            raise RuntimeError("TensorRT engine build failed")
+        with open(engine_path, "wb") as f:
+            f.write(serialized)
+    
+    def _calibration_images(self) -> List[np.ndarray]:
+        """Preprocess up to TRT_CALIBRATION_IMAGES representative images from TRT_CALIBRATION_DIR"""
+        calibration_dir = os.getenv("TRT_CALIBRATION_DIR")
+        if not calibration_dir or not os.path.isdir(calibration_dir):
+            return []
+        
+        images = []
+        for name in sorted(os.listdir(calibration_dir)):
+            if len(images) >= TRT_CALIBRATION_IMAGES:
+                break
+            image = cv2.imdecode(np.fromfile(os.path.join(calibration_dir, name), dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            out = np.empty((3, *self.input_size), dtype=np.float32)
+            self._preprocess(image, out)
+            images.append(out)
+        
+        logger.info(f"Loaded {len(images)} INT8 calibration images from {calibration_dir}")
+        return images
+    
+    def _configure_preprocessing(self, processor: ViTImageProcessor) -> None:
+        """Cache the processor's input size and normalization for _preprocess"""
+        size = processor.size
+        self.input_size = (size["height"], size["width"])
+        # Normalization in 0-255 pixel units so preprocessing is a single
+        # vectorized (x - mean) * inv_std
+        self._mean = np.array(processor.image_mean, dtype=np.float32) * 255
+        self._inv_std = 1.0 / (np.array(processor.image_std, dtype=np.float32) * 255)
+    
+    def _preprocess(self, image: np.ndarray, out: np.ndarray) -> None:
+        """Resize and normalize a BGR uint8 image into a (3, H, W) float32 buffer row"""
+        height, width = self.input_size
+        # INTER_AREA averages every source pixel when shrinking, like the
+        # antialiased resize of ViTImageProcessor; INTER_LINEAR would alias
+        if image.shape[0] >= height and image.shape[1] >= width:
+            interpolation = cv2.INTER_AREA
+        else:
+            interpolation = cv2.INTER_LINEAR
+        # Resize first so the color conversion and normalization run on the small image
+        resized = cv2.resize(image, (width, height), interpolation=interpolation)
+        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        # Normalize through an HWC view so the CHW row is written in place
+        hwc = out.transpose(1, 2, 0)
+        np.subtract(rgb, self._mean, out=hwc, dtype=np.float32)
+        np.multiply(hwc, self._inv_std, out=hwc)
+    
+    def _preprocess_tensor(self, image: torch.Tensor, out: torch.Tensor) -> None:
+        """Resize and normalize an RGB uint8 (3, H, W) GPU tensor into a (3, H, W) float32 buffer row"""
+        resized = F.interpolate(
+            image[None].float(), size=self.input_size, mode="bilinear", align_corners=False, antialias=True
+        )
+        torch.sub(resized[0], self._mean_t, out=out).mul_(self._inv_std_t)
+    
+    def _input_buffers(self, batch_size: int) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """Return the reusable (host, device) input buffers sliced to batch_size rows"""
+        if self._host_input is None or self._host_input.shape[0] < batch_size:
+            shape = (batch_size, 3, *self.input_size)
+            # Pinned host memory lets host->device copies run asynchronously
+            self._host_input = torch.empty(shape, pin_memory=self._gpu_decode, memory_format=self._memory_format)
+            self._device_input = (
+                torch.empty(shape, device=self.device, memory_format=self._memory_format)
+                if self._gpu_decode else None
+            )
+        
+        device_input = self._device_input[:batch_size] if self._device_input is not None else None
+        return self._host_input[:batch_size], device_input
+    
+    def _forward(self, pixel_values: Any) -> np.ndarray:
+        """Run the model on a batch of pixel_values and return the logits as a NumPy array"""
+        if self.ort_session is not None:
+            if isinstance(pixel_values, torch.Tensor):
+                pixel_values = pixel_values.numpy()
+            return self.ort_session.run(None, {"pixel_values": pixel_values})[0]
+        
+        if isinstance(pixel_values, np.ndarray):
+            pixel_values = torch.from_numpy(pixel_values).to(self.device)
+        if self.trt_context is not None:
+            return self._forward_tensorrt(pixel_values)
+        if self._autocast_dtype is None:
+            with torch.inference_mode():
+                return self.model(pixel_values=pixel_values).logits.cpu().numpy() # type: ignore
+        
+        if self.device.type == "cuda":
+            pixel_values = pixel_values.half()
+        with torch.inference_mode(), torch.autocast(device_type=self.device.type, dtype=self._autocast_dtype):
+            return self.model(pixel_values=pixel_values).logits.float().cpu().numpy() # type: ignore
+    
+    def _forward_tensorrt(self, pixel_values: torch.Tensor) -> np.ndarray:
+        """Run the TensorRT engine in chunks of at most TRT_MAX_BATCH images"""
+        logits = np.empty((pixel_values.shape[0], len(self.id2label)), dtype=np.float32)
+        # Inputs were written on the default stream
+        self._trt_stream.wait_stream(torch.cuda.current_stream()) # type: ignore
+        with torch.cuda.stream(self._trt_stream): # type: ignore
+            for start in range(0, pixel_values.shape[0], TRT_MAX_BATCH):
+                chunk = pixel_values[start:start + TRT_MAX_BATCH].contiguous()
+                self.trt_context.set_input_shape("pixel_values", tuple(chunk.shape))
+                self.trt_context.set_tensor_address("pixel_values", chunk.data_ptr())
+                self.trt_context.set_tensor_address("logits", self._trt_output.data_ptr()) # type: ignore
+                self.trt_context.execute_async_v3(self._trt_stream.cuda_stream) # type: ignore
+                logits[start:start + chunk.shape[0]] = self._trt_output[:chunk.shape[0]].cpu().numpy() # type: ignore
+        return logits
+    
     def validate_image_path(self, image_path: str) -> None:
         """Validate image file path and accessibility"""
         if not os.path.exists(image_path):
@@ -72,186 +632,321 @@ class FoodClassifier:
         """Fetch nutrition data from USDA API with comprehensive error handling"""
         try:
             # Clean the food name for better API results
-            clean_name = food_name.replace("_", " ").strip()
-            
-            url = "https://api.nal.usda.gov/fdc/v1/foods/search"
-            params = {
-                "query": clean_name,
-                "api_key": self.api_key,
-                "pageSize": 1,
-                "dataType": ["Foundation", "SR Legacy"]  # Focus on more reliable data
-            }
-            
-            logger.info(f"Searching USDA database for: {clean_name}")
-            response = requests.get(url, params=params, timeout=15)
-            
-            if response.status_code == 403:
-                logger.error("Invalid API key for USDA")
-                return {"error": "USDA API authentication failed - check API key"}
-            
-            if response.status_code == 429:
-                logger.warning("Rate limit exceeded for USDA API")
-                return {"error": "USDA API rate limit exceeded. Please try again later"}
-            
-            if response.status_code != 200:
-                logger.warning(f"USDA API returned status {response.status_code}")
-                return {"error": f"USDA API error: {response.status_code}"}
-            
-            data = response.json()
+            clean_name = food_name.replace("_", " ").strip().lower()
             
-            if not data.get("foods"):
-                logger.info(f"No nutrition data found in USDA database for: {clean_name}")
-                return {
-                    "error": "No nutrition data found in USDA database",
-                    "searched_term": clean_name,
-                    "suggestion": "Try a more generic food name or check spelling"
-                }
-            
-            food = data["foods"][0]
-            food_nutrients = food.get('foodNutrients', [])
-            
-            # Create a more robust nutrient mapping
-            nutrient_map = {
-                'Energy': ['Energy', 'Calories'],
-                'Protein': ['Protein'],
-                'Total lipid (fat)': ['Total lipid (fat)', 'Fat, total'],
-                'Carbohydrate, by difference': ['Carbohydrate, by difference', 'Carbohydrates'],
-                'Fiber, total dietary': ['Fiber, total dietary', 'Dietary fiber'],
-                'Sugars, total including NLEA': ['Sugars, total including NLEA', 'Sugars'],
-                'Sodium, Na': ['Sodium, Na', 'Sodium']
-            }
-            
-            nutrients = {}
-            for nutrient in food_nutrients:
-                nutrient_name = nutrient.get('nutrientName', '')
-                nutrient_value = nutrient.get('value', 0)
-                nutrient_unit = nutrient.get('unitName', '')
-                
-                # Map nutrients to standardized names
-                for standard_name, variations in nutrient_map.items():
-                    if any(var.lower() in nutrient_name.lower() for var in variations):
-                        nutrients[standard_name] = f"{nutrient_value} {nutrient_unit}"
-                        break
+            description, data_source, fdc_id, nutrients = self._usda_lookup(clean_name)
+            formatted = nutrients.formatted()
             
             result = {
-                "food_description": food.get("description", clean_name),
-                "data_source": food.get("dataType", "Unknown"),
-                "fdc_id": food.get("fdcId"),
-                "nutrients": nutrients
+                "food_description": description,
+                "data_source": data_source,
+                "fdc_id": fdc_id,
+                "nutrients": {
+                    standard_name: formatted[field]
+                    for standard_name, field in NUTRIENT_FIELDS.items()
+                    if field in formatted
+                }
             }
             
             # Add basic nutrients with fallback values
             basic_nutrients = {
-                "calories": nutrients.get("Energy", "N/A"),
-                "protein": nutrients.get("Protein", "N/A"),
-                "fat": nutrients.get("Total lipid (fat)", "N/A"),
-                "carbs": nutrients.get("Carbohydrate, by difference", "N/A"),
-                "fiber": nutrients.get("Fiber, total dietary", "N/A"),
-                "sodium": nutrients.get("Sodium, Na", "N/A")
+                "calories": formatted.get("calories", "N/A"),
+                "protein": formatted.get("protein", "N/A"),
+                "fat": formatted.get("fat", "N/A"),
+                "carbs": formatted.get("carbs", "N/A"),
+                "fiber": formatted.get("fiber", "N/A"),
+                "sodium": formatted.get("sodium", "N/A")
             }
             
             result.update(basic_nutrients)
-            logger.info(f"Successfully retrieved nutrition data for: {food['description']}")
             return result
             
-        except requests.exceptions.Timeout:
+        except USDALookupError as e:
+            return e.result
+        except httpx.TimeoutException:
             logger.error("Timeout when calling USDA API")
             return {"error": "USDA API timeout. Please try again"}
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             logger.error("Connection error when calling USDA API")
             return {"error": "Cannot connect to USDA API. Check internet connection"}
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Request error when calling USDA API: {e}")
             return {"error": f"USDA API request failed: {str(e)}"}
         except Exception as e:
             logger.error(f"Unexpected error in USDA API call: {e}")
             return {"error": f"Unexpected error occurred: {str(e)}"}
     
-    def analyze_image(self, image_path: str) -> Dict[str, Any]:
-        """Analyze image and return food prediction with nutrition information"""
-        try:
-            # Ensure model is loaded
-            if not self.is_loaded:
-                self.load_model()
+    def _fetch_usda(self, clean_name: str) -> Tuple[str, str, Optional[int], Nutrients]:
+        """Query USDA for a cleaned food name and return an immutable, cacheable result
+
+        Failed lookups raise instead of returning, so lru_cache never stores them.
+        """
+        url = "https://api.nal.usda.gov/fdc/v1/foods/search"
+        params = {
+            "query": clean_name,
+            "api_key": self.api_key,
+            "pageSize": 1,
+            "dataType": ["Foundation", "SR Legacy"]  # Focus on more reliable data
+        }
+        
+        logger.info(f"Searching USDA database for: {clean_name}")
+        response = self._http.get(url, params=params)
+        
+        if response.status_code == 403:
+            logger.error("Invalid API key for USDA")
+            raise USDALookupError({"error": "USDA API authentication failed - check API key"})
+        
+        if response.status_code == 429:
+            logger.warning("Rate limit exceeded for USDA API")
+            raise USDALookupError({"error": "USDA API rate limit exceeded. Please try again later"})
+        
+        if response.status_code != 200:
+            logger.warning(f"USDA API returned status {response.status_code}")
+            raise USDALookupError({"error": f"USDA API error: {response.status_code}"})
+        
+        data = USDA_RESPONSE_DECODER.decode(response.content)
+        
+        if not data.foods:
+            logger.info(f"No nutrition data found in USDA database for: {clean_name}")
+            raise USDALookupError({
+                "error": "No nutrition data found in USDA database",
+                "searched_term": clean_name,
+                "suggestion": "Try a more generic food name or check spelling"
+            })
+        
+        food = data.foods[0]
+        description = food.description if food.description is not None else clean_name
+        
+        values: Dict[str, float] = {}
+        units: Dict[str, str] = {}
+        lookup = NUTRIENT_LOOKUP
+        for nutrient in food.foodNutrients:
+            if nutrient.value is None:
+                continue
+            nutrient_name = nutrient.nutrientName.lower()
             
+            # Map nutrients to standardized fields: exact match first, then the
+            # longest variation contained in the name
+            field = lookup.get(nutrient_name)
+            if field is None:
+                for key in NUTRIENT_KEYS_BY_LENGTH:
+                    if key in nutrient_name:
+                        field = lookup[key]
+                        break
+                else:
+                    continue
+            values[field] = nutrient.value
+            units[field] = nutrient.unitName
+        
+        logger.info(f"Successfully retrieved nutrition data for: {description}")
+        return (
+            description,
+            food.dataType,
+            food.fdcId,
+            Nutrients(units=units, **values)
+        )
+    
+    def close(self) -> None:
+        """Release pooled HTTP connections and worker threads"""
+        self._http.close()
+        self._pool.shutdown(wait=False)
+    
+    def _decode_image(self, image_path: str, input_size: Tuple[int, int]) -> Dict[str, Any]:
+        """Validate and decode one image for a model input of input_size, returning the decoded image or an error"""
+        try:
             # Validate image path
             self.validate_image_path(image_path)
+        except Exception as e:
+            logger.error(f"Invalid image path {image_path}: {e}")
+            return {"error": f"Analysis failed: {str(e)}"}
+        
+        # Load and validate image
+        try:
+            logger.info(f"Processing image: {image_path}")
+            data = np.fromfile(image_path, dtype=np.uint8)
             
-            # Load and validate image
-            try:
-                logger.info(f"Processing image: {image_path}")
-                image = Image.open(image_path)
-                
-                # Convert to RGB if necessary
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                # Validate image dimensions
-                width, height = image.size
+            # JPEGs are decoded straight into GPU memory by nvJPEG when running on CUDA
+            is_jpeg = data[:3].tobytes() == JPEG_MAGIC
+            image_t = None
+            if self._gpu_decode and is_jpeg:
+                try:
+                    image_t = decode_jpeg(torch.from_numpy(data), mode=ImageReadMode.RGB, device=self.device)
+                except RuntimeError as e:
+                    # Leave image_t unset so OpenCV decodes whatever nvJPEG could not
+                    logger.warning(f"GPU JPEG decode failed for {image_path}, decoding on the CPU instead: {e}")
+            if image_t is not None:
+                height, width = image_t.shape[1:]
                 if width < 50 or height < 50:
                     return {"error": "Image too small. Minimum size: 50x50 pixels"}
-                
-                if width > 4000 or height > 4000:
-                    logger.warning(f"Large image detected: {width}x{height}. Consider resizing for faster processing")
-                
-            except UnidentifiedImageError:
+                return {"image": image_t, "width": width, "height": height}
+            
+            # Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg, sized
+            # from the header so the model input never needs upsampling
+            header_size = jpeg_size(data) if is_jpeg else None
+            flags, scale = cv2.IMREAD_COLOR, 1
+            if header_size is not None:
+                width, height = header_size
+                if width < 50 or height < 50:
+                    return {"error": "Image too small. Minimum size: 50x50 pixels"}
+                flags, scale = self._reduced_decode_mode(width, height, input_size)
+            
+            # imdecode instead of imread so non-ASCII paths work on Windows
+            image = cv2.imdecode(data, flags)
+            if image is None:
                 return {"error": "Invalid or corrupted image file"}
+            
+            if header_size is None:
+                # Validate image dimensions
+                height, width = image.shape[:2]
+                if width < 50 or height < 50:
+                    return {"error": "Image too small. Minimum size: 50x50 pixels"}
+            elif abs(image.shape[1] * scale - height) < abs(image.shape[1] * scale - width):
+                # EXIF orientation transposed the decoded image; report what it shows
+                width, height = height, width
+            
+            return {"image": image, "width": width, "height": height}
+            
+        except Exception as e:
+            logger.error(f"Error loading image: {e}")
+            return {"error": f"Failed to load image: {str(e)}"}
+    
+    @staticmethod
+    def _reduced_decode_mode(width: int, height: int, input_size: Tuple[int, int]) -> Tuple[int, int]:
+        """Pick the cv2 imread flags and scale decoding a JPEG to at least 2x the model input"""
+        target_height, target_width = input_size
+        for scale, flags in JPEG_REDUCED_MODES:
+            if width // scale >= 2 * target_width and height // scale >= 2 * target_height:
+                return flags, scale
+        return cv2.IMREAD_COLOR, 1
+    
+    def _prepare_image(self, image: Any, host_row: torch.Tensor, device_row: Optional[torch.Tensor]) -> Optional[str]:
+        """Preprocess a decoded image into its batch buffer row, returning an error message on failure"""
+        try:
+            if isinstance(image, torch.Tensor):
+                self._preprocess_tensor(image, device_row) # type: ignore
+            else:
+                self._preprocess(image, host_row.numpy())
+                if device_row is not None:
+                    device_row.copy_(host_row, non_blocking=True)
+        except Exception as e:
+            logger.error(f"Error preprocessing image: {e}")
+            return f"Failed to load image: {str(e)}"
+        return None
+    
+    def analyze_image(self, image_path: str) -> Dict[str, Any]:
+        """Analyze image and return food prediction with nutrition information"""
+        return self.analyze_images([image_path])[0]
+    
+    def analyze_images(self, image_paths: List[str]) -> List[Dict[str, Any]]:
+        """Analyze several images with a single batched forward pass"""
+        # Load the model in the background while the images are read and decoded,
+        # which doesn't need the weights. Decoding does need the input size, so it
+        # comes from the (small, cached) processor config rather than from
+        # self.input_size, which load_model sets concurrently
+        load_future = None
+        input_size = self.input_size
+        if not self.is_loaded:
+            try:
+                size = _load_processor(MODEL_NAME).size
             except Exception as e:
-                logger.error(f"Error loading image: {e}")
-                return {"error": f"Failed to load image: {str(e)}"}
+                logger.error(f"Unexpected error in image analysis: {e}")
+                return [{"error": f"Analysis failed: {str(e)}"} for _ in image_paths]
+            input_size = (size["height"], size["width"])
+            load_future = self._pool.submit(self.load_model)
+        
+        # Decode in parallel; OpenCV and nvJPEG release the GIL while working
+        decoded = list(self._pool.map(functools.partial(self._decode_image, input_size=input_size), image_paths))
+        
+        try:
+            # Ensure model is loaded
+            if load_future is not None:
+                load_future.result()
+        except Exception as e:
+            logger.error(f"Unexpected error in image analysis: {e}")
+            return [{"error": f"Analysis failed: {str(e)}"} for _ in image_paths]
+        
+        results: List[Dict[str, Any]] = list(decoded)
+        decoded_ok = [i for i, item in enumerate(decoded) if "error" not in item]
+        if not decoded_ok:
+            return results
+        
+        # The input buffers are shared, so one batch fills and runs at a time
+        with self._input_lock:
+            host_input, device_input = self._input_buffers(len(decoded_ok))
+            device_rows = list(device_input) if device_input is not None else [None] * len(decoded_ok)
+            errors = list(self._pool.map(
+                self._prepare_image, [decoded[i]["image"] for i in decoded_ok], host_input, device_rows
+            ))
+            rows = [row for row, error in enumerate(errors) if error is None]
+            for i, error in zip(decoded_ok, errors):
+                if error is not None:
+                    results[i] = {"error": error}
+            ready = [decoded_ok[row] for row in rows]
+            if not ready:
+                return results
             
             # Perform prediction
             try:
                 start_time = time.time()
-                inputs = self.processor(images=image, return_tensors="pt") # type: ignore
+                batch = device_input if device_input is not None else host_input
+                if len(rows) < len(decoded_ok):
+                    # Drop the rows of images that failed preprocessing
+                    batch = batch[rows].contiguous(memory_format=self._memory_format)
                 
-                with torch.no_grad():
-                    outputs = self.model(**inputs) # type: ignore
-                    logits = outputs.logits
-                    predicted_class_idx = logits.argmax(-1).item()
-                    confidence = torch.softmax(logits, dim=-1).max().item()
-                    label = self.model.config.id2label[predicted_class_idx] # type: ignore
+                logits = self._forward(batch)
+                predicted_class_idx = logits.argmax(-1)
+                max_logits = np.take_along_axis(logits, predicted_class_idx[:, None], -1)
+                # The top-1 softmax probability is 1 / sum(exp(logits - max_logit)),
+                # so no normalized probability array is ever materialized
+                confidences = 1.0 / np.exp(logits - max_logits).sum(-1)
                 
                 inference_time = time.time() - start_time
-                readable_label = label.replace("_", " ")
-                
-                logger.info(f"Prediction: {readable_label} (confidence: {confidence:.3f}, time: {inference_time:.3f}s)")
-                
-                # Check confidence threshold
-                if confidence < 0.3:
-                    return {
-                        "predicted_food": readable_label,
-                        "confidence": round(confidence, 3),
-                        "warning": "Low confidence prediction. Consider using a clearer image",
-                        "nutrition": {"error": "Skipped nutrition lookup due to low confidence"},
-                        "inference_time": round(inference_time, 3)
-                    }
-                
             except Exception as e:
                 logger.error(f"Model inference error: {e}")
-                return {"error": f"Failed to analyze image: {str(e)}"}
+                for i in ready:
+                    results[i] = {"error": f"Failed to analyze image: {str(e)}"}
+                return results
+        
+        # Start all nutrition lookups at once so their HTTP round trips overlap;
+        # images with the same label share a single lookup
+        nutrition_futures = {}
+        confident = []
+        for i, class_idx, confidence in zip(ready, predicted_class_idx, confidences):
+            readable_label = self.id2label[int(class_idx)].replace("_", " ")
+            confidence = float(confidence)
+            logger.info(f"Prediction: {readable_label} (confidence: {confidence:.3f}, time: {inference_time:.3f}s)")
             
-            # Get nutrition information
-            logger.info("Fetching nutrition information...")
-            nutrition_info = self.get_nutrition_usda(readable_label)
+            # Check confidence threshold
+            if confidence < CONFIDENCE_THRESHOLD:
+                results[i] = {
+                    "predicted_food": readable_label,
+                    "confidence": round(confidence, 3),
+                    "warning": "Low confidence prediction. Consider using a clearer image",
+                    "nutrition": {"error": "Skipped nutrition lookup due to low confidence"},
+                    "inference_time": round(inference_time, 3)
+                }
+                continue
             
-            result = {
+            if readable_label not in nutrition_futures:
+                logger.info(f"Fetching nutrition information for: {readable_label}")
+                nutrition_futures[readable_label] = self._pool.submit(self.get_nutrition_usda, readable_label)
+            confident.append((i, readable_label, confidence))
+        
+        # Get nutrition information
+        for i, readable_label, confidence in confident:
+            results[i] = {
                 "predicted_food": readable_label,
                 "confidence": round(confidence, 3),
-                "nutrition": nutrition_info,
+                "nutrition": nutrition_futures[readable_label].result(),
                 "inference_time": round(inference_time, 3),
                 "image_info": {
-                    "path": image_path,
-                    "dimensions": f"{width}x{height}",
-                    "mode": image.mode
+                    "path": image_paths[i],
+                    "dimensions": f"{decoded[i]['width']}x{decoded[i]['height']}",
+                    "mode": "RGB"
                 }
             }
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Unexpected error in image analysis: {e}")
-            return {"error": f"Analysis failed: {str(e)}"}
+        
+        return results
 
 def main():
     """Main function for command-line usage"""
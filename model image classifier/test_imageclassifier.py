@@ -0,0 +1,56 @@
+"""Tests for FoodClassifier's OpenCV/NumPy preprocessing and JPEG header parsing"""
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from transformers import ViTImageProcessor
+
+from imageclassifier import FoodClassifier, jpeg_size
+
+def make_processor() -> ViTImageProcessor:
+    """Same preprocessing configuration as nateraw/vit-base-food101, without a download"""
+    return ViTImageProcessor(
+        size={"height": 224, "width": 224},
+        image_mean=[0.5, 0.5, 0.5],
+        image_std=[0.5, 0.5, 0.5]
+    )
+
+def make_classifier(processor: ViTImageProcessor) -> FoodClassifier:
+    """FoodClassifier configured for preprocessing only (no model, USDA key or HTTP client)"""
+    classifier = FoodClassifier.__new__(FoodClassifier)
+    classifier._configure_preprocessing(processor)
+    return classifier
+
+def make_photo(height: int, width: int) -> np.ndarray:
+    """Synthetic RGB photo: smooth color gradients plus per-pixel sensor-like noise"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        127 + 100 * np.sin(x / (width / 7)),
+        127 + 100 * np.cos(y / (height / 5)),
+        127 + 100 * np.sin((x + y) / (width / 3))
+    ], axis=-1)
+    noise = rng.normal(0, 20, (height, width, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+@pytest.mark.parametrize("height, width", [(3024, 4032), (1080, 1920), (480, 640), (224, 224)])
+def test_preprocess_matches_processor(height, width):
+    processor = make_processor()
+    classifier = make_classifier(processor)
+    rgb = make_photo(height, width)
+
+    expected = processor(images=Image.fromarray(rgb), return_tensors="np")["pixel_values"][0]
+    actual = np.empty((3, 224, 224), dtype=np.float32)
+    classifier._preprocess(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), actual)
+
+    # Both are normalized to [-1, 1]; 0.03 is about 4 gray levels
+    diff = np.abs(actual - expected)
+    assert diff.mean() < 0.03
+    assert np.percentile(diff, 99) < 0.15
+
+def test_jpeg_size():
+    rgb = make_photo(300, 400)
+    # imencode returns an (N, 1) array; files are read as flat arrays
+    ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+    assert ok
+    assert jpeg_size(encoded.ravel()) == (400, 300)